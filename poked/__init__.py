@@ -1,5 +1,6 @@
 __version__ = "0.10.0"
 
-from .client import PokemonClient, list_pokemon
+from .client import PokemonClient, iter_pokemon, list_pokemon
 
 from .colors import type_color_map
+from .datasets import iter_dataset, load_dataset, pokemon_learning
@@ -1,5 +1,9 @@
-import poked.client as client
+import argparse
 import asyncio
+import sys
+
+import poked.client as client
+import poked.export as export
 
 
 async def main():
@@ -8,6 +12,134 @@ async def main():
     print(df)
 
 
+async def export_command(args):
+    format = args.format
+    if format is None and args.output:
+        format = export.format_for_filename(args.output)
+    format = format or "csv"
+
+    columns = None
+    if args.columns:
+        columns = [column.strip() for column in args.columns.split(",")]
+
+    chunks = client.iter_pokemon(chunk_size=args.chunk_size)
+    binary = format == "parquet"
+
+    if args.output:
+        out = open(args.output, "wb") if binary else open(args.output, "w", newline="")
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+
+    try:
+        rows = await export.export(
+            chunks,
+            out,
+            format=format,
+            columns=columns,
+            where=args.where,
+            list_separator=args.list_separator,
+            list_columns=client.list_columns,
+        )
+    finally:
+        if args.output:
+            out.close()
+
+    print(f"Exported {rows} pokemon", file=sys.stderr)
+
+
+async def warm_cache_command(args):
+    try:
+        count = await client.warm_cache(chunk_size=args.chunk_size)
+    except Exception as e:
+        raise RuntimeError(f"Could not warm the cache from PokeAPI: {e}")
+
+    print(f"Cached {count} pokemon", file=sys.stderr)
+
+
+async def query_command(args):
+    pokemon = await client.get_pokemon(args.name)
+
+    if args.json:
+        print(pokemon.to_json())
+    else:
+        print(pokemon.to_string())
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="poked", description="Play with Pokemon data from PokeAPI"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    export_parser = subparsers.add_parser(
+        "export", help="stream all pokemon out as CSV, NDJSON or Parquet"
+    )
+    export_parser.add_argument(
+        "-o", "--output", help="file to write to (default: stdout)"
+    )
+    export_parser.add_argument(
+        "-f",
+        "--format",
+        choices=export.FORMATS,
+        help="output format (default: from the output filename, otherwise csv)",
+    )
+    export_parser.add_argument(
+        "-c", "--columns", help="comma separated list of columns to export"
+    )
+    export_parser.add_argument(
+        "-w",
+        "--where",
+        help='filter rows with a DataFrame.query() expression, e.g. "HP > 100"',
+    )
+    export_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=200,
+        help="number of pokemon to convert and write at a time (default: 200)",
+    )
+    export_parser.add_argument(
+        "--list-separator",
+        default="|",
+        help="separator for list columns in CSV output (default: |)",
+    )
+    export_parser.set_defaults(func=export_command)
+
+    warm_parser = subparsers.add_parser(
+        "warm-cache", help="fetch and cache the pokemon list for list and export"
+    )
+    warm_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=200,
+        help="page size to cache, matching export --chunk-size (default: 200)",
+    )
+    warm_parser.set_defaults(func=warm_cache_command)
+
+    query_parser = subparsers.add_parser("query", help="look up a pokemon by name")
+    query_parser.add_argument("name", help="name of the pokemon, e.g. pikachu")
+    query_parser.add_argument("--json", action="store_true", help="print as JSON")
+    query_parser.set_defaults(func=query_command)
+
+    return parser
+
+
+def run(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    # Without a command, just show the DataFrame
+    if args.command is None:
+        asyncio.run(main())
+        return
+
+    try:
+        asyncio.run(args.func(args))
+    except (ValueError, RuntimeError) as e:
+        parser.exit(1, f"poked: error: {e}\n")
+    except BrokenPipeError:
+        # Piped into something like head that stopped reading
+        sys.stderr.close()
+
+
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
+    run()
@@ -13,6 +13,7 @@
 import hashlib
 import json
 import os
+import time
 
 import appdirs
 
@@ -42,6 +43,15 @@ def get_cached_query(query):
             return None
 
 
+def get_cache_age(query):
+    """Return how many seconds ago the given query was cached, or None if not cached"""
+    filename = get_cache_filename(query)
+    if not os.path.exists(filename):
+        return None
+
+    return time.time() - os.path.getmtime(filename)
+
+
 def cache_query(query, result):
     """Cache the result for the given query"""
     filename = get_cache_filename(query)
@@ -1,37 +1,189 @@
-from typing import Optional
+import asyncio
+import atexit
+import functools
+import json
+import random
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+import aiohttp
 import pandas as pd
 
 # We use the gql library to build GraphQL queries
 from gql import Client, gql
 from gql.transport.aiohttp import AIOHTTPTransport
+from gql.transport.async_transport import AsyncTransport
+from gql.transport.exceptions import TransportServerError
 
 # We use the cache to cache the results of queries
 import poked.cache as cache
 import poked.queries as queries
 
+# Other processes on the host can share one copy of the DataFrame
+import poked.shared as shared
+
 # The endpoint for the GraphQL API
 endpoint = "https://beta.pokeapi.co/graphql/v1beta"
 
-transport = AIOHTTPTransport(url=endpoint)
+# Old data to fall back on when PokeAPI can't be reached
+fallback_url = "https://poke-sprites.vercel.app/data.json"
+
+
+def default_transport() -> AsyncTransport:
+    """Return a transport that talks to the PokeAPI GraphQL endpoint"""
+    return AIOHTTPTransport(url=endpoint)
+
+
+# Builds the transport for each query session. A gql transport can only be
+# connected to one session at a time, so concurrent queries each need their
+# own. Swap this out to run queries somewhere else, e.g. with the recording
+# and replay transports in poked.transports.
+transport_factory: Callable[[], AsyncTransport] = default_transport
+
+
+def cache_key(query, variables=None):
+    """Return the cache key for a query and its variables"""
+    # Queries without variables keep using the bare query as their key so
+    # existing cache entries stay valid
+    if not variables:
+        return query
+
+    return query + json.dumps(variables, sort_keys=True)
+
+
+class RefreshPolicy:
+    """How cached results are revalidated and how failed queries are retried"""
+
+    def __init__(
+        self,
+        max_age: Optional[float] = None,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ):
+        # Seconds before a cached result is refreshed in the background. None
+        # means cached results are served forever.
+        self.max_age = max_age
+        # How many times to retry a failed query, and the base and maximum
+        # delay in seconds for the exponential backoff between attempts
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def is_stale(self, age: Optional[float]) -> bool:
+        """Return whether a cached result of the given age should be refreshed"""
+        return self.max_age is not None and age is not None and age > self.max_age
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Return how long to wait before retrying after the given attempt"""
+        # Full jitter keeps concurrent callers from retrying in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of querying PokeAPI while it keeps failing"""
+
 
+class CircuitBreaker:
+    """Stop sending queries to an endpoint after repeated failures"""
 
-def autocache(func):
-    """A decorator to automatically cache results"""
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        """Return whether a query may be sent right now"""
+        if self.opened_at is None:
+            return True
+
+        # Once the timeout has passed, let queries through to test the waters.
+        # Another failure opens the circuit again.
+        return time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+# The refresh policy used by run_query when none is given
+refresh_policy = RefreshPolicy()
+
+# Shared by every query to the endpoint
+breaker = CircuitBreaker()
+
+# Background refreshes in flight, by cache key
+_revalidating: Dict[str, asyncio.Future] = {}
+
+# Failures worth retrying, since they may well succeed next time. Anything
+# else, like a query PokeAPI rejects, fails the same way every time.
+transient_errors = (TransportServerError, aiohttp.ClientError, asyncio.TimeoutError)
+
+# The fallback data as fetched, so it's only downloaded once
+_fallback_text: Optional[str] = None
+
+
+def revalidate(key, func, args, kwargs) -> asyncio.Future:
+    """
+    Refresh the cached result for key in the background
+
+    Returns a future for the fresh result, which is None if it couldn't be
+    fetched.
+    """
+    # Only one refresh per key at a time
+    if key in _revalidating:
+        return _revalidating[key]
+
+    async def refresh():
+        try:
+            result = await func(*args, **kwargs)
+            cache.cache_query(key, result)
+            return result
+        except Exception as e:
+            print("Error refreshing cached query, keeping the cached result")
+            print(e)
+            return None
+        finally:
+            del _revalidating[key]
 
+    _revalidating[key] = asyncio.ensure_future(refresh())
+    return _revalidating[key]
+
+
+def autocache(func, policy: Optional[RefreshPolicy] = None):
+    """
+    A decorator to automatically cache results
+
+    If a refresh policy is given (or passed to the call as policy), cached
+    results older than its max_age are still returned right away while a
+    fresh result is fetched in the background.
+    """
+
+    @functools.wraps(func)
     async def wrapped(*args, **kwargs):
-        # Get the query from the function's arguments
+        # Get the query and its variables from the function's arguments
         query = args[0]
+        variables = args[1] if len(args) > 1 else kwargs.get("variables")
+        key = cache_key(query, variables)
+        refresh = kwargs.get("policy") or policy
 
         # Check if it's cached
-        cached = cache.get_cached_query(query)
+        cached = cache.get_cached_query(key)
         if cached:
+            if refresh is not None and refresh.is_stale(cache.get_cache_age(key)):
+                revalidate(key, func, args, kwargs)
             return cached
 
         # Otherwise, run the function
         result = await func(*args, **kwargs)
 
         # Cache the result
-        cache.cache_query(query, result)
+        cache.cache_query(key, result)
 
         return result
 
@@ -39,38 +191,137 @@ def autocache(func):
 
 
 @autocache
-async def run_query(
+async def execute_query(
     query,
     # Variables
     variables=None,
     client=None,
+    policy: Optional[RefreshPolicy] = None,
 ):
-    """Run the given query on the GraphQL endpoint"""
+    """
+    Run the given query on the GraphQL endpoint
+
+    Transient failures are retried with backoff according to the policy.
+    Unlike run_query, errors are raised rather than falling back on old data.
+    """
+    policy = policy or refresh_policy
+
     # The query can either be a string or the result of gql()
 
     # If it's a string, convert it to a gql object
     if isinstance(query, str):
         query = gql(query)
 
-    try:
-        # If they have a client, use that
-        if client:
-            return await client.execute(query, variable_values=variables)
-
-        # Otherwise, create a new client
-        async with Client(
-            transport=transport, fetch_schema_from_transport=True
-        ) as session:
-            result = await session.execute(query, variable_values=variables)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError("PokeAPI is failing, not sending queries for now")
+
+        try:
+            # If they have a client, use that
+            if client:
+                result = await client.execute(query, variable_values=variables)
+            else:
+                # Otherwise, create a new client
+                async with Client(
+                    transport=transport_factory(), fetch_schema_from_transport=True
+                ) as session:
+                    result = await session.execute(query, variable_values=variables)
+        except transient_errors:
+            breaker.record_failure()
+            if attempt >= policy.retries:
+                raise
+            await asyncio.sleep(policy.backoff_delay(attempt))
+            attempt += 1
+        else:
+            breaker.record_success()
             return result
+
+
+async def run_query(
+    query,
+    # Variables
+    variables=None,
+    client=None,
+    policy: Optional[RefreshPolicy] = None,
+):
+    """Run the given query on the GraphQL endpoint"""
+    try:
+        return await execute_query(
+            query,
+            variables=variables,
+            client=client,
+            policy=policy or refresh_policy,
+        )
     except Exception as e:
         print("Error running query against PokeAPI")
         print(e)
 
         print("Falling back on old data")
+        return await fallback_data()
+
+
+async def fallback_data():
+    """Return the old data to fall back on, downloading it the first time"""
+    global _fallback_text
+
+    if _fallback_text is None:
         import requests
 
-        return requests.get("https://poke-sprites.vercel.app/data.json").json()
+        # Don't block the event loop while downloading
+        response = await asyncio.to_thread(requests.get, fallback_url)
+        response.raise_for_status()
+        _fallback_text = response.text
+
+    # Parse a fresh copy each time since converting it modifies it in place
+    return json.loads(_fallback_text)
+
+
+def fetched_at(query, variables=None) -> float:
+    """Return when the cached result for a query was fetched, or now if it isn't"""
+    age = cache.get_cache_age(cache_key(query, variables))
+    return time.time() - (age or 0)
+
+
+# Cache keys of in-memory DataFrames being rebuilt in the background
+_rebuilding: Set[str] = set()
+
+
+def revalidate_frame(
+    built_from: Optional[float], query, rebuild: Callable[[dict], None]
+) -> None:
+    """
+    Rebuild an in-memory DataFrame in the background once its data is stale
+
+    built_from is when the data the DataFrame was built from was fetched.
+    Once that's older than refresh_policy allows, the query is refreshed and
+    rebuild is called with the fresh result. Until then the stale DataFrame
+    keeps being used.
+    """
+    if built_from is None or not refresh_policy.is_stale(time.time() - built_from):
+        return
+
+    key = cache_key(query)
+    if key in _rebuilding:
+        return
+    _rebuilding.add(key)
+
+    def done(future: asyncio.Future):
+        _rebuilding.discard(key)
+        if future.cancelled() or future.result() is None:
+            return
+
+        try:
+            rebuild(future.result())
+        except Exception as e:
+            print("Error rebuilding from the refreshed query, keeping the old data")
+            print(e)
+
+    # Share the refresh with any already running for the cached result
+    future = revalidate(
+        key, execute_query.__wrapped__, (query,), {"policy": refresh_policy}
+    )
+    future.add_done_callback(done)
 
 
 def convert_list_query_data(list_of_pokemon):
@@ -207,15 +458,108 @@ def convert_list_query_data(list_of_pokemon):
     return df
 
 
+# Numeric columns that some pokemon have no value for. In the full list these
+# come out as float64 because of the gaps, so chunks are cast to match
+nullable_numeric_columns = [
+    "Base Experience",
+    "Number of Appearances",
+    "Evolution Chain Length",
+]
+
+
+# Columns holding lists of names
+list_columns = ["Game Appearances", "Evolution Chain"]
+
+
+def stable_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast a chunk of converted pokemon so its dtypes don't depend on its rows"""
+    return df.astype(
+        {column: "float64" for column in nullable_numeric_columns if column in df}
+    )
+
+
 class PokemonClient:
     # Cache the DataFrame to make lookup quick
     _all_pokemon_df: Optional[pd.DataFrame] = None
 
+    # When the data the DataFrame was built from was fetched
+    _fetched_at: Optional[float] = None
+
+    # When set, the DataFrame is shared with other processes through this
+    _shared: Optional[shared.SharedFrame] = None
+
+    @classmethod
+    def use_shared_memory(cls, name: str = shared.DEFAULT_NAME) -> None:
+        """
+        Read the DataFrame from shared memory published by another process
+
+        Newer versions are picked up automatically on the next lookup.
+        """
+        cls._shared = shared.SharedFrame(name)
+        cls._attach_shared()
+
+    @classmethod
+    async def publish_shared_memory(cls, name: str = shared.DEFAULT_NAME) -> int:
+        """
+        Build the DataFrame and publish it to shared memory for other processes
+
+        Calling this again publishes a fresh version. Returns the version.
+        """
+        result = await run_query(queries.pokemon_list_query)
+        cls._all_pokemon_df = convert_list_query_data(result["pokemon_v2_pokemon"])
+
+        if cls._shared is None or cls._shared.name != name:
+            cls._shared = shared.SharedFrame(name)
+        return cls._shared.publish(cls._all_pokemon_df)
+
+    @classmethod
+    def close_shared_memory(cls) -> None:
+        """
+        Stop using shared memory, unlinking the DataFrame if we published it
+
+        This happens automatically when the process exits.
+        """
+        if cls._shared is None:
+            return
+
+        frame, cls._shared = cls._shared, None
+        cls._all_pokemon_df = None
+        if frame.publishing:
+            frame.unlink()
+        else:
+            frame.close()
+
+    @classmethod
+    def _revalidate(cls) -> None:
+        """Rebuild the DataFrame in the background once its data is stale"""
+        # A shared DataFrame is kept fresh by publishing it again
+        if cls._shared is not None:
+            return
+
+        def rebuild(result):
+            cls._all_pokemon_df = convert_list_query_data(result["pokemon_v2_pokemon"])
+            cls._fetched_at = time.time()
+
+        revalidate_frame(cls._fetched_at, queries.pokemon_list_query, rebuild)
+
+    @classmethod
+    def _attach_shared(cls) -> None:
+        """Swap to the latest shared DataFrame if a new version was published"""
+        if cls._shared is None:
+            return
+
+        df = cls._shared.refresh()
+        if df is not None:
+            cls._all_pokemon_df = df
+
     @classmethod
     async def get_pokemon(cls, name: str) -> pd.Series:
         """
         Get a pokemon by name
         """
+        cls._attach_shared()
+        cls._revalidate()
+
         # Assume we can use the cached DataFrame and not have to go through
         # copying the dataframe
         all_pokemon: Optional[pd.DataFrame] = cls._all_pokemon_df
@@ -231,14 +575,144 @@ class PokemonClient:
 
     @classmethod
     async def list_pokemon(cls) -> pd.DataFrame:
+        """
+        Get all pokemon as a DataFrame
+
+        Normally this is a copy you're free to modify. In shared memory mode
+        it's the shared DataFrame itself, which must be treated as read-only;
+        call .copy() on it first if you need to change it.
+        """
+        cls._attach_shared()
+        cls._revalidate()
+
         if cls._all_pokemon_df is not None:
+            # Copying would defeat the point of sharing one DataFrame
+            if cls._shared is not None:
+                return cls._all_pokemon_df
             return cls._all_pokemon_df.copy()
 
         # Execute the query on a transport
         result = await run_query(queries.pokemon_list_query)
         cls._all_pokemon_df = convert_list_query_data(result["pokemon_v2_pokemon"])
+        cls._fetched_at = fetched_at(queries.pokemon_list_query)
         return cls._all_pokemon_df.copy()
 
+    @classmethod
+    async def iter_pokemon(cls, chunk_size: int = 100) -> AsyncIterator[pd.DataFrame]:
+        """
+        Iterate over all pokemon as DataFrames of at most chunk_size rows
+
+        Pages are fetched (or read from the cache) one at a time and converted
+        as they arrive, so only one chunk is held in memory at once. Columns
+        that can be missing are always float64, as they are in the full list,
+        even when a chunk happens to have no gaps.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+
+        cls._attach_shared()
+        cls._revalidate()
+
+        # If we've already built the full DataFrame, just slice it up
+        if cls._all_pokemon_df is not None:
+            async for chunk in slice_frame(cls._all_pokemon_df, chunk_size):
+                yield chunk
+            return
+
+        async for chunk in iter_pages(
+            queries.pokemon_page_query,
+            "pokemon_v2_pokemon",
+            chunk_size,
+            lambda page: stable_dtypes(convert_list_query_data(page)),
+        ):
+            yield chunk
+
+
+def table_rows(result: dict, table: str) -> List[dict]:
+    """Pull a table's rows out of a query result"""
+    # The old data run_query falls back on only has the pokemon list
+    if table not in result:
+        raise RuntimeError(f"No {table} data available from PokeAPI")
+    return result[table]
+
+
+async def slice_frame(df: pd.DataFrame, chunk_size: int) -> AsyncIterator[pd.DataFrame]:
+    """Iterate over copies of df in chunks of chunk_size rows"""
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start : start + chunk_size].copy()
+
+
+async def iter_pages(
+    query: str,
+    table: str,
+    chunk_size: int,
+    convert: Callable[[List[dict]], pd.DataFrame],
+) -> AsyncIterator[pd.DataFrame]:
+    """
+    Run a paged query with $limit and $offset, converting each page
+
+    The query is run a page at a time until a short page comes back. If a
+    page can't be fetched, the rest comes from the old fallback data instead,
+    which isn't paginated, so it's chunked here starting from where we got to.
+    """
+    offset = 0
+    while True:
+        try:
+            result = await execute_query(
+                query,
+                variables={"limit": chunk_size, "offset": offset},
+                policy=refresh_policy,
+            )
+        except Exception as e:
+            print("Error running query against PokeAPI")
+            print(e)
+
+            print("Falling back on old data")
+            page = table_rows(await fallback_data(), table)[offset:]
+            for start in range(0, len(page), chunk_size):
+                yield convert(page[start : start + chunk_size])
+            return
+
+        page = table_rows(result, table)
+        if page:
+            yield convert(page)
+
+        # A short page means we've reached the end
+        if len(page) < chunk_size:
+            return
+
+        offset += chunk_size
+
+
+async def warm_cache(chunk_size: int = 100) -> int:
+    """
+    Fetch and cache the pokemon list, both whole and in pages of chunk_size
+
+    The pages are the ones iter_pokemon reads with the same chunk_size.
+    Unlike run_query, this doesn't fall back on old data, which isn't cached,
+    so errors are raised. Returns the number of pokemon cached.
+    """
+    result = await execute_query(queries.pokemon_list_query)
+
+    offset = 0
+    while True:
+        page = await execute_query(
+            queries.pokemon_page_query,
+            variables={"limit": chunk_size, "offset": offset},
+        )
+
+        # A short page means we've reached the end
+        if len(page["pokemon_v2_pokemon"]) < chunk_size:
+            break
+
+        offset += chunk_size
+
+    return len(result["pokemon_v2_pokemon"])
+
+
+# Let go of the shared DataFrame before poked.shared closes its segments
+atexit.register(PokemonClient.close_shared_memory)
 
 get_pokemon = PokemonClient.get_pokemon
 list_pokemon = PokemonClient.list_pokemon
+iter_pokemon = PokemonClient.iter_pokemon
@@ -0,0 +1,277 @@
+# Load PokeAPI tables other than the pokemon list into DataFrames
+#
+# Each table is described by a Dataset in poked.queries. The conversion here
+# is shared by all of them and works column-wise with pandas rather than row
+# by row: nested objects are flattened with json_normalize, and nested lists
+# are normalized into long frames that are grouped or pivoted back onto the
+# index.
+#
+# Queries go through run_query, so they're cached like the pokemon list, and
+# loaded DataFrames can be shared between processes the same way.
+
+import asyncio
+import atexit
+import time
+from typing import AsyncIterator, Dict, List, Union
+
+import pandas as pd
+
+import poked.client as client
+import poked.queries as queries
+import poked.shared as shared
+
+# Cache the DataFrames to make lookups quick, by dataset name
+_frames: Dict[str, pd.DataFrame] = {}
+
+# When the data each cached DataFrame was built from was fetched
+_fetched_at: Dict[str, float] = {}
+
+# Datasets shared with other processes, by dataset name
+_shared: Dict[str, shared.SharedFrame] = {}
+
+# Metadata columns from json_normalize get this prefix so they can't clash
+# with a field of the same name in the nested rows
+_META = "_meta."
+
+
+def get_dataset(dataset: Union[str, queries.Dataset]) -> queries.Dataset:
+    """Look up a dataset by name"""
+    if isinstance(dataset, queries.Dataset):
+        return dataset
+
+    if dataset not in queries.datasets:
+        raise ValueError(
+            f"Unknown dataset {dataset}, expected one of {', '.join(queries.datasets)}"
+        )
+    return queries.datasets[dataset]
+
+
+def _normalize_list(dataset: queries.Dataset, rows: List[dict], relation: str, values):
+    """Flatten a nested list into a long frame with the row's index alongside"""
+    long = pd.json_normalize(
+        rows,
+        record_path=relation.split("."),
+        meta=[dataset.index],
+        meta_prefix=_META,
+    )
+    # There may be no nested rows at all, in which case there are no columns
+    return long.reindex(columns=[_META + dataset.index] + values)
+
+
+def convert(
+    dataset: queries.Dataset, rows: List[dict], categories: bool = True
+) -> pd.DataFrame:
+    """
+    Convert rows returned by the dataset's query into a DataFrame
+
+    With categories=False, category columns are plain objects instead. Pages
+    converted one at a time would each get their own categories otherwise,
+    and concatenating them would lose the category dtype anyway.
+    """
+    paths = [dataset.index] + list(dataset.columns.values())
+
+    # Missing nested objects leave their columns out, so make sure they exist
+    df = pd.json_normalize(rows).reindex(columns=paths)
+    df.columns = [dataset.index] + list(dataset.columns)
+    df = df.set_index(dataset.index)
+
+    for column, rule in dataset.lists.items():
+        long = _normalize_list(dataset, rows, rule.relation, [rule.value])
+        collected = long.groupby(_META + dataset.index)[rule.value].agg(list)
+        df[column] = collected.reindex(df.index).astype(object)
+        df[column] = df[column].where(df[column].notna(), None)
+
+    for column, rule in dataset.pivots.items():
+        long = _normalize_list(dataset, rows, rule.relation, [rule.key, rule.value])
+        wide = long.drop_duplicates([_META + dataset.index, rule.key]).pivot(
+            index=_META + dataset.index, columns=rule.key, values=rule.value
+        )
+        wide.columns = [
+            rule.names.get(key, f"{column} ({key})") for key in wide.columns
+        ]
+        df = df.join(wide)
+
+    # Make sure named pivot columns exist even if no row had that key
+    for column, rule in dataset.pivots.items():
+        for name in rule.names.values():
+            if name not in df.columns:
+                df[name] = None
+
+    dtypes = {
+        column: dtype if categories or dtype != "category" else object
+        for column, dtype in dataset.dtypes.items()
+        if column in df
+    }
+    return df.astype(dtypes)
+
+
+def _attach_shared(dataset: queries.Dataset) -> None:
+    """Swap to the latest shared DataFrame if a new version was published"""
+    if dataset.name not in _shared:
+        return
+
+    df = _shared[dataset.name].refresh()
+    if df is not None:
+        _frames[dataset.name] = df
+
+
+def _revalidate(dataset: queries.Dataset) -> None:
+    """Rebuild the cached DataFrame in the background once its data is stale"""
+
+    def rebuild(result):
+        _frames[dataset.name] = convert(
+            dataset, client.table_rows(result, dataset.table)
+        )
+        _fetched_at[dataset.name] = time.time()
+
+    # Shared DataFrames have no fetch time, they're kept fresh by publishing
+    client.revalidate_frame(_fetched_at.get(dataset.name), dataset.query(), rebuild)
+
+
+async def _load(dataset: queries.Dataset) -> pd.DataFrame:
+    """Return the cached DataFrame for dataset, building it if needed"""
+    _attach_shared(dataset)
+    _revalidate(dataset)
+
+    if dataset.name not in _frames:
+        result = await client.run_query(dataset.query())
+        _frames[dataset.name] = convert(
+            dataset, client.table_rows(result, dataset.table)
+        )
+        _fetched_at[dataset.name] = client.fetched_at(dataset.query())
+
+    return _frames[dataset.name]
+
+
+async def load_dataset(dataset: Union[str, queries.Dataset]) -> pd.DataFrame:
+    """
+    Get a whole dataset as a DataFrame, e.g. load_dataset("moves")
+
+    The available datasets are listed in poked.queries.datasets.
+    """
+    df = await _load(get_dataset(dataset))
+    return df.copy()
+
+
+async def iter_dataset(
+    dataset: Union[str, queries.Dataset], chunk_size: int = 100
+) -> AsyncIterator[pd.DataFrame]:
+    """
+    Iterate over a dataset as DataFrames of at most chunk_size rows
+
+    Chunks fetched a page at a time have object columns in place of category
+    columns, since the categories can't be known until the whole dataset has
+    been seen.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    dataset = get_dataset(dataset)
+    _attach_shared(dataset)
+    _revalidate(dataset)
+
+    # If we've already built the full DataFrame, just slice it up
+    if dataset.name in _frames:
+        async for chunk in client.slice_frame(_frames[dataset.name], chunk_size):
+            yield chunk
+        return
+
+    async for chunk in client.iter_pages(
+        dataset.query(paged=True),
+        dataset.table,
+        chunk_size,
+        lambda page: convert(dataset, page, categories=False),
+    ):
+        yield chunk
+
+
+async def publish_shared_memory(dataset: Union[str, queries.Dataset]) -> int:
+    """
+    Build a dataset and publish it to shared memory for other processes
+
+    Calling this again publishes a fresh version. Returns the version.
+    """
+    dataset = get_dataset(dataset)
+
+    result = await client.run_query(dataset.query())
+    df = convert(dataset, client.table_rows(result, dataset.table))
+
+    if dataset.name not in _shared:
+        _shared[dataset.name] = shared.SharedFrame(shared_name(dataset))
+    version = _shared[dataset.name].publish(df)
+
+    # Like the readers, we're kept fresh by publishing again
+    _frames[dataset.name] = df
+    _fetched_at.pop(dataset.name, None)
+    return version
+
+
+def use_shared_memory(dataset: Union[str, queries.Dataset]) -> None:
+    """Read a dataset from shared memory published by another process"""
+    dataset = get_dataset(dataset)
+    _shared[dataset.name] = shared.SharedFrame(shared_name(dataset))
+    _fetched_at.pop(dataset.name, None)
+    _attach_shared(dataset)
+
+
+def close_shared_memory() -> None:
+    """
+    Stop using shared memory for every dataset, unlinking those we published
+
+    This happens automatically when the process exits.
+    """
+    for name, frame in list(_shared.items()):
+        del _shared[name]
+        _frames.pop(name, None)
+        if frame.publishing:
+            frame.unlink()
+        else:
+            frame.close()
+
+
+# Let go of shared DataFrames before poked.shared closes their segments
+atexit.register(close_shared_memory)
+
+
+def shared_name(dataset: queries.Dataset) -> str:
+    """Return the shared memory name a dataset is published under"""
+    return f"{shared.DEFAULT_NAME}_{dataset.name}"
+
+
+async def pokemon_learning(move: str) -> pd.DataFrame:
+    """
+    Get the pokemon that can learn the given move, e.g. "thunderbolt"
+
+    Includes the ways each pokemon can learn it as Learn Methods, and the
+    lowest level it's learned at by leveling up as Level, which is missing
+    for pokemon that can only be taught it.
+    """
+    moves, pokemon = await asyncio.gather(_load(queries.moves), client.list_pokemon())
+    if not (moves["Name"] == move).any():
+        raise ValueError(f"Move {move} not found")
+
+    # Only fetch the learnset rows for this move rather than the whole table
+    result = await client.run_query(
+        queries.learnsets.query(where="pokemon_v2_move.name"),
+        variables={"value": move},
+    )
+    learned = convert(
+        queries.learnsets, client.table_rows(result, queries.learnsets.table)
+    )
+
+    methods = (
+        learned[["Pokemon ID", "Learn Method"]]
+        .astype({"Learn Method": str})
+        .drop_duplicates()
+        .sort_values("Learn Method")
+        .groupby("Pokemon ID")["Learn Method"]
+        .agg(list)
+    )
+    levels = (
+        learned[learned["Learn Method"] == "level-up"]
+        .groupby("Pokemon ID")["Level"]
+        .min()
+    )
+
+    learners = pd.DataFrame({"Learn Methods": methods, "Level": levels})
+    return pokemon.join(learners, how="inner")
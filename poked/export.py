@@ -0,0 +1,188 @@
+# Stream DataFrame chunks out as CSV, NDJSON or Parquet
+#
+# Chunks are written as they arrive, so exporting never holds more than one
+# chunk of converted data in memory.
+
+from typing import AsyncIterator, List, Optional
+
+import pandas as pd
+
+FORMATS = ["csv", "ndjson", "parquet"]
+
+
+def format_for_filename(filename: str) -> Optional[str]:
+    """Guess the export format from a filename's extension"""
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension in ["json", "jsonl", "ndjson"]:
+        return "ndjson"
+    if extension in ["csv", "parquet"]:
+        return extension
+    return None
+
+
+async def prepare_chunks(
+    chunks: AsyncIterator[pd.DataFrame],
+    columns: Optional[List[str]] = None,
+    where: Optional[str] = None,
+) -> AsyncIterator[pd.DataFrame]:
+    """Filter and select columns from each chunk, keeping columns consistent"""
+    first = True
+    async for chunk in chunks:
+        # Pin the columns to the first chunk's so every chunk lines up, even
+        # if a later one has an extra column like Type (3)
+        if first:
+            if columns is None:
+                columns = list(chunk.columns)
+
+            missing = [column for column in columns if column not in chunk.columns]
+            if missing:
+                raise ValueError(f"Unknown columns: {', '.join(missing)}")
+
+            first = False
+
+        if where:
+            chunk = chunk.query(where)
+
+        chunk = chunk.reindex(columns=columns)
+        if len(chunk):
+            yield chunk.reset_index()
+
+
+def detect_list_columns(df: pd.DataFrame) -> List[str]:
+    """Return the columns of df that hold lists"""
+    return [
+        column
+        for column in df.select_dtypes(include="object").columns
+        if df[column].map(lambda value: isinstance(value, list)).any()
+    ]
+
+
+async def write_csv(
+    chunks: AsyncIterator[pd.DataFrame],
+    out,
+    list_separator: str = "|",
+    list_columns: Optional[List[str]] = None,
+) -> int:
+    """
+    Write chunks to out as CSV, joining lists with list_separator
+
+    Without list_columns, every chunk is checked for columns holding lists,
+    since a list column can be all None in any one chunk.
+    """
+    rows = 0
+    async for chunk in chunks:
+        if list_columns is None:
+            lists = detect_list_columns(chunk)
+        else:
+            lists = [column for column in list_columns if column in chunk]
+
+        for column in lists:
+            chunk[column] = chunk[column].str.join(list_separator)
+
+        chunk.to_csv(out, header=rows == 0, index=False)
+        rows += len(chunk)
+
+    return rows
+
+
+async def write_ndjson(chunks: AsyncIterator[pd.DataFrame], out) -> int:
+    """Write chunks to out as newline-delimited JSON"""
+    rows = 0
+    async for chunk in chunks:
+        lines = chunk.to_json(orient="records", lines=True)
+        out.write(lines if lines.endswith("\n") else lines + "\n")
+        rows += len(chunk)
+
+    return rows
+
+
+def arrow_schema(df: pd.DataFrame, list_columns: List[str]):
+    """
+    Build a Parquet schema for df that later chunks can be held to
+
+    Types are decided by kind rather than inferred from the values, so a
+    column that happens to be all None in the first chunk still gets the
+    right type.
+    """
+    import pyarrow as pa
+
+    fields = []
+    for column, dtype in df.dtypes.items():
+        if column in list_columns:
+            type = pa.list_(pa.string())
+        elif pd.api.types.is_bool_dtype(dtype):
+            type = pa.bool_()
+        elif pd.api.types.is_integer_dtype(dtype):
+            type = pa.int64()
+        elif pd.api.types.is_float_dtype(dtype):
+            type = pa.float64()
+        else:
+            type = pa.string()
+        fields.append(pa.field(column, type))
+
+    return pa.schema(fields)
+
+
+async def write_parquet(
+    chunks: AsyncIterator[pd.DataFrame],
+    out,
+    list_columns: Optional[List[str]] = None,
+) -> int:
+    """Write chunks to out as a Parquet file, one row group per chunk"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+    rows = 0
+    writer = None
+    try:
+        async for chunk in chunks:
+            # Categories are written as plain strings
+            categories = chunk.select_dtypes(include="category").columns
+            chunk = chunk.astype({column: object for column in categories})
+
+            if writer is None:
+                lists = list(list_columns or []) + detect_list_columns(chunk)
+                writer = pq.ParquetWriter(out, arrow_schema(chunk, lists))
+
+            table = pa.Table.from_pandas(
+                chunk, schema=writer.schema, preserve_index=False
+            )
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return rows
+
+
+async def export(
+    chunks: AsyncIterator[pd.DataFrame],
+    out,
+    format: str = "csv",
+    columns: Optional[List[str]] = None,
+    where: Optional[str] = None,
+    list_separator: str = "|",
+    list_columns: Optional[List[str]] = None,
+) -> int:
+    """
+    Write chunks to out in the given format and return the number of rows
+
+    columns picks which columns to write and where is a DataFrame.query()
+    expression to filter rows by. list_columns names the columns holding
+    lists; when it isn't given they're detected from the data. out must be a
+    text stream for csv and ndjson, and a binary stream for parquet.
+    """
+    prepared = prepare_chunks(chunks, columns, where)
+
+    if format == "csv":
+        return await write_csv(prepared, out, list_separator, list_columns)
+    if format == "ndjson":
+        return await write_ndjson(prepared, out)
+    if format == "parquet":
+        return await write_parquet(prepared, out, list_columns)
+
+    raise ValueError(f"Unknown format {format}, expected one of {', '.join(FORMATS)}")
@@ -1,7 +1,7 @@
-# Query for the Pokemon list
-pokemon_list_query = """
-    query GetPokemon {
-      pokemon_v2_pokemon {
+from typing import Any, Dict, List, Optional
+
+# The fields queried for each Pokemon, shared by the list and page queries
+pokemon_fields = """
         id
         name
         base_experience
@@ -45,6 +45,231 @@ pokemon_list_query = """
             name
           }
         }
-      }
+"""
+
+# Query for the Pokemon list
+pokemon_list_query = (
+    """
+    query GetPokemon {
+      pokemon_v2_pokemon {"""
+    + pokemon_fields
+    + """      }
+    }
+"""
+)
+
+# Query for a single page of the Pokemon list, ordered by id so that
+# limit/offset pagination is stable
+pokemon_page_query = (
+    """
+    query GetPokemonPage($limit: Int, $offset: Int) {
+      pokemon_v2_pokemon(limit: $limit, offset: $offset, order_by: {id: asc}) {"""
+    + pokemon_fields
+    + """      }
     }
 """
+)
+
+
+class ListRule:
+    """Collect a value from each row of a nested list into a list column"""
+
+    def __init__(self, relation: str, value: str):
+        self.relation = relation
+        self.value = value
+
+
+class PivotRule:
+    """
+    Spread a nested list out into one column per key
+
+    Columns are named "<column> (<key>)" unless names maps the key to
+    something else, like slot 1 to "Type (Primary)".
+    """
+
+    def __init__(
+        self,
+        relation: str,
+        key: str,
+        value: str,
+        names: Optional[Dict[Any, str]] = None,
+    ):
+        self.relation = relation
+        self.key = key
+        self.value = value
+        self.names = names or {}
+
+
+class Dataset:
+    """
+    A PokeAPI table and how to flatten it into a DataFrame
+
+    columns maps column names to dotted paths in each row, such as
+    "Type": "pokemon_v2_type.name". The GraphQL query is built from those
+    paths along with the ones in the list and pivot rules.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        table: str,
+        columns: Dict[str, str],
+        lists: Optional[Dict[str, ListRule]] = None,
+        pivots: Optional[Dict[str, PivotRule]] = None,
+        dtypes: Optional[Dict[str, str]] = None,
+        index: str = "id",
+    ):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.lists = lists or {}
+        self.pivots = pivots or {}
+        self.dtypes = dtypes or {}
+        self.index = index
+
+    def fields(self) -> List[str]:
+        """Return the dotted paths of every field to query"""
+        fields = [self.index] + list(self.columns.values())
+        for rule in self.lists.values():
+            fields.append(f"{rule.relation}.{rule.value}")
+        for rule in self.pivots.values():
+            fields.append(f"{rule.relation}.{rule.key}")
+            fields.append(f"{rule.relation}.{rule.value}")
+        return fields
+
+    def query(
+        self,
+        paged: bool = False,
+        where: Optional[str] = None,
+        where_type: str = "String!",
+    ) -> str:
+        """
+        Return the GraphQL query for the dataset
+
+        paged adds $limit and $offset variables. where is a dotted path that
+        rows are filtered on, keeping only those equal to the $value variable,
+        e.g. "pokemon_v2_move.name".
+        """
+        operation = "Get" + self.name.title().replace("_", "")
+        variables = []
+        arguments = [f"order_by: {{{self.index}: asc}}"]
+
+        if where:
+            operation += "Where"
+            variables.append(f"$value: {where_type}")
+            condition = "{_eq: $value}"
+            for part in reversed(where.split(".")):
+                condition = f"{{{part}: {condition}}}"
+            arguments.insert(0, f"where: {condition}")
+
+        if paged:
+            operation += "Page"
+            variables = ["$limit: Int", "$offset: Int"] + variables
+            arguments = ["limit: $limit", "offset: $offset"] + arguments
+
+        if variables:
+            operation += f"({', '.join(variables)})"
+
+        return (
+            f"\n    query {operation} {{\n"
+            f"      {self.table}({', '.join(arguments)}) {{\n"
+            f"{_selection(self.fields(), 8)}"
+            f"      }}\n"
+            f"    }}\n"
+        )
+
+
+def _selection(paths: List[str], indent: int) -> str:
+    """Render dotted paths as a nested GraphQL selection set"""
+    tree: Dict[str, Any] = {}
+    for path in paths:
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+
+    def render(node: Dict[str, Any], indent: int) -> str:
+        lines = ""
+        for field, children in node.items():
+            if children:
+                lines += " " * indent + field + " {\n"
+                lines += render(children, indent + 2)
+                lines += " " * indent + "}\n"
+            else:
+                lines += " " * indent + field + "\n"
+        return lines
+
+    return render(tree, indent)
+
+
+moves = Dataset(
+    name="moves",
+    table="pokemon_v2_move",
+    columns={
+        "Name": "name",
+        "Type": "pokemon_v2_type.name",
+        "Damage Class": "pokemon_v2_movedamageclass.name",
+        "Power": "power",
+        "PP": "pp",
+        "Accuracy": "accuracy",
+        "Priority": "priority",
+        "Generation": "pokemon_v2_generation.name",
+    },
+    dtypes={
+        "Type": "category",
+        "Damage Class": "category",
+        "Power": "Int64",
+        "PP": "Int64",
+        "Accuracy": "Int64",
+        "Priority": "Int64",
+        "Generation": "category",
+    },
+)
+
+abilities = Dataset(
+    name="abilities",
+    table="pokemon_v2_ability",
+    columns={
+        "Name": "name",
+        "Main Series": "is_main_series",
+        "Generation": "pokemon_v2_generation.name",
+    },
+    lists={
+        "Pokemon": ListRule("pokemon_v2_pokemonabilities", "pokemon_v2_pokemon.name"),
+    },
+    dtypes={"Generation": "category"},
+)
+
+items = Dataset(
+    name="items",
+    table="pokemon_v2_item",
+    columns={
+        "Name": "name",
+        "Cost": "cost",
+        "Fling Power": "fling_power",
+        "Category": "pokemon_v2_itemcategory.name",
+    },
+    dtypes={"Cost": "Int64", "Fling Power": "Int64", "Category": "category"},
+)
+
+# Which pokemon learn which moves, how, and in which games. This is a very
+# large table, so prefer iter_dataset or a filtered query over loading it all.
+learnsets = Dataset(
+    name="learnsets",
+    table="pokemon_v2_pokemonmove",
+    columns={
+        "Pokemon ID": "pokemon_id",
+        "Move ID": "move_id",
+        "Level": "level",
+        "Learn Method": "pokemon_v2_movelearnmethod.name",
+        "Version Group": "pokemon_v2_versiongroup.name",
+    },
+    dtypes={
+        "Pokemon ID": "int64",
+        "Move ID": "int64",
+        "Level": "Int64",
+        "Learn Method": "category",
+        "Version Group": "category",
+    },
+)
+
+datasets = {dataset.name: dataset for dataset in [moves, abilities, items, learnsets]}
@@ -0,0 +1,351 @@
+# Share a DataFrame between processes on the same host
+#
+# One process builds the DataFrame and publishes it into a shared memory
+# segment. Other processes attach to that segment instead of fetching and
+# converting the data themselves.
+#
+# The DataFrame is pickled with protocol 5 so that the numpy buffers backing
+# numeric columns are stored out-of-band. When attaching, those buffers are
+# handed back to pickle as read-only views into the shared memory, so numeric
+# columns are not copied. Object columns (names, lists of games, etc.) are
+# rebuilt from the pickle in each process.
+#
+# A small "<name>" pointer segment holds a generation, picked at random when
+# the pointer is created, and the current version. Each publish writes a new
+# segment named "<name>_<generation>_v<version>" and then bumps the version.
+# Readers open the pointer by name whenever they check it, so a publisher
+# restarting with a new pointer (and a new generation) is picked up too.
+#
+# Segments live as long as the publishing process does: they're unlinked when
+# it exits, or earlier with unlink().
+
+import atexit
+import gc
+import pickle
+import random
+import struct
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+DEFAULT_NAME = "poked"
+
+# Pickle length and number of out-of-band buffers
+_HEADER = struct.Struct("<QQ")
+# Offset and length of each buffer
+_SPAN = struct.Struct("<QQ")
+# The generation and version stored in the pointer segment
+_POINTER = struct.Struct("<QQ")
+
+# Keep buffers aligned so numpy gets nicely aligned arrays
+_ALIGN = 64
+
+# Pointer segments we publish through, by name
+_pointers: Dict[str, shared_memory.SharedMemory] = {}
+# Data segments we've published or attached to, by name. These must stay
+# open for as long as a DataFrame built on top of them is alive.
+_segments: Dict[str, shared_memory.SharedMemory] = {}
+# Segments we attached to that the resource tracker was told to forget
+_untracked: Set[str] = set()
+# Every SharedFrame, so their DataFrames can be dropped at exit
+_frames: "weakref.WeakSet[SharedFrame]" = weakref.WeakSet()
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _segment_name(name: str, generation: int, version: int) -> str:
+    return f"{name}_{generation:08x}_v{version}"
+
+
+def _segment_owner(segment_name: str) -> str:
+    """Return the name a data segment was published under"""
+    return segment_name.rsplit("_", 2)[0]
+
+
+def _open(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing segment without taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # type: ignore
+    except TypeError:
+        # Before Python 3.13 attaching registers the segment with the resource
+        # tracker, which would unlink it when this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore
+        _untracked.add(shm._name)  # type: ignore
+        return shm
+
+
+def _unlink(shm: shared_memory.SharedMemory) -> None:
+    """Unlink a segment, whether we created it or attached to it"""
+    # Before Python 3.13 unlinking tells the resource tracker to forget the
+    # segment, which it complains about if it already had
+    if shm._name in _untracked:  # type: ignore
+        resource_tracker.register(shm._name, "shared_memory")  # type: ignore
+        _untracked.discard(shm._name)  # type: ignore
+    shm.unlink()
+
+
+def _read_pointer(name: str) -> Tuple[int, int]:
+    """Return the generation and version published under name, or (0, 0)"""
+    pointer = _pointers.get(name)
+    if pointer is not None:
+        return _POINTER.unpack_from(pointer.buf)
+
+    # Open it fresh rather than keeping it open, since a publisher that
+    # restarts replaces the pointer with a new one
+    try:
+        pointer = _open(name)
+    except FileNotFoundError:
+        return 0, 0
+
+    try:
+        return _POINTER.unpack_from(pointer.buf)
+    finally:
+        pointer.close()
+
+
+def _publisher_pointer(name: str) -> shared_memory.SharedMemory:
+    """Return the pointer segment to publish through, creating it if needed"""
+    pointer = _pointers.get(name)
+    if pointer is not None:
+        return pointer
+
+    try:
+        # Carry on from a publisher that went away without unlinking
+        pointer = _open(name)
+    except FileNotFoundError:
+        pointer = shared_memory.SharedMemory(name=name, create=True, size=_POINTER.size)
+        _POINTER.pack_into(pointer.buf, 0, random.getrandbits(32), 0)
+
+    _pointers[name] = pointer
+    return pointer
+
+
+def _release(segment_name: str) -> None:
+    """Close a data segment if nothing is still using it"""
+    shm = _segments.get(segment_name)
+    if shm is None:
+        return
+
+    try:
+        shm.close()
+    except BufferError:
+        # A DataFrame still points into it, leave it open
+        return
+
+    del _segments[segment_name]
+
+
+def current_version(name: str = DEFAULT_NAME) -> int:
+    """Return the version currently published under name, or 0 if none"""
+    return _read_pointer(name)[1]
+
+
+def publish(df: pd.DataFrame, name: str = DEFAULT_NAME) -> int:
+    """Publish df to shared memory under name and return its new version"""
+    buffers: List[pickle.PickleBuffer] = []
+    payload = pickle.dumps(df, protocol=5, buffer_callback=buffers.append)
+    raw_buffers = [b.raw() for b in buffers]
+
+    # Lay out the header, the pickle and then each buffer
+    offset = _align(_HEADER.size + _SPAN.size * len(raw_buffers) + len(payload))
+    spans = []
+    for raw in raw_buffers:
+        spans.append((offset, raw.nbytes))
+        offset = _align(offset + raw.nbytes)
+
+    pointer = _publisher_pointer(name)
+    generation, previous = _POINTER.unpack_from(pointer.buf)
+    version = previous + 1
+
+    shm = shared_memory.SharedMemory(
+        name=_segment_name(name, generation, version),
+        create=True,
+        size=max(offset, 1),
+    )
+    _HEADER.pack_into(shm.buf, 0, len(payload), len(raw_buffers))
+    position = _HEADER.size
+    for span in spans:
+        _SPAN.pack_into(shm.buf, position, *span)
+        position += _SPAN.size
+    shm.buf[position : position + len(payload)] = payload
+    for (start, length), raw in zip(spans, raw_buffers):
+        shm.buf[start : start + length] = raw.cast("B")
+
+    _segments[shm.name] = shm
+
+    # Everything is in place, swap readers over to the new version
+    _POINTER.pack_into(pointer.buf, 0, generation, version)
+
+    # Readers that already attached to the old version keep their mapping
+    if previous:
+        old = _segments.get(_segment_name(name, generation, previous))
+        if old is not None:
+            _unlink(old)
+            _release(old.name)
+
+    return version
+
+
+def _attach(name: str) -> Optional[Tuple[int, int, pd.DataFrame]]:
+    """Attach to the DataFrame published under name with its generation"""
+    # The publisher may swap and unlink a version between us reading the
+    # pointer and opening the segment, in which case we try again
+    for _ in range(3):
+        generation, version = _read_pointer(name)
+        if not version:
+            return None
+
+        segment_name = _segment_name(name, generation, version)
+        shm = _segments.get(segment_name)
+        if shm is None:
+            try:
+                shm = _open(segment_name)
+            except FileNotFoundError:
+                continue
+            _segments[segment_name] = shm
+
+        view = shm.buf.toreadonly()
+        payload_length, buffer_count = _HEADER.unpack_from(view)
+        position = _HEADER.size
+        buffers = []
+        for _ in range(buffer_count):
+            start, length = _SPAN.unpack_from(view, position)
+            buffers.append(view[start : start + length])
+            position += _SPAN.size
+
+        df = pickle.loads(view[position : position + payload_length], buffers=buffers)
+
+        # Let go of older versions we'd attached to
+        for other in list(_segments):
+            if other != segment_name and _segment_owner(other) == name:
+                _release(other)
+
+        return generation, version, df
+
+    return None
+
+
+def attach(name: str = DEFAULT_NAME) -> Optional[Tuple[int, pd.DataFrame]]:
+    """
+    Attach to the DataFrame published under name
+
+    Returns the version and the DataFrame, or None if nothing is published.
+    Numeric columns are read-only views into shared memory.
+    """
+    attached = _attach(name)
+    if attached is None:
+        return None
+
+    _, version, df = attached
+    return version, df
+
+
+def unlink(name: str = DEFAULT_NAME) -> None:
+    """Remove the published DataFrame and its pointer from shared memory"""
+    generation, version = _read_pointer(name)
+    if version:
+        segment_name = _segment_name(name, generation, version)
+        shm = _segments.get(segment_name)
+        try:
+            if shm is not None:
+                _unlink(shm)
+            else:
+                shm = _open(segment_name)
+                _unlink(shm)
+                shm.close()
+        except FileNotFoundError:
+            pass
+        _release(segment_name)
+
+    pointer = _pointers.pop(name, None)
+    if pointer is None:
+        try:
+            pointer = _open(name)
+        except FileNotFoundError:
+            return
+
+    _unlink(pointer)
+    pointer.close()
+
+
+def _close_all() -> None:
+    """Unlink what we published and close every segment when exiting"""
+    for frame in list(_frames):
+        frame.close()
+
+    # DataFrames can hold on to their buffers through reference cycles
+    gc.collect()
+
+    for name in list(_pointers):
+        unlink(name)
+
+    for segment_name in list(_segments):
+        _release(segment_name)
+
+
+atexit.register(_close_all)
+
+
+class SharedFrame:
+    """
+    A DataFrame published under a name, kept up to date with new versions
+
+    Used both by the process publishing the DataFrame and by the processes
+    reading it.
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME):
+        self.name = name
+        self.generation = 0
+        self.version = 0
+        self.df: Optional[pd.DataFrame] = None
+        # Whether this process publishes the DataFrame rather than reading it
+        self.publishing = False
+        _frames.add(self)
+
+    def refresh(self) -> Optional[pd.DataFrame]:
+        """Swap to the latest version if a new one was published, and return it"""
+        generation, version = _read_pointer(self.name)
+        if version and (generation, version) != (self.generation, self.version):
+            attached = _attach(self.name)
+            if attached is not None:
+                self.generation, self.version, self.df = attached
+
+        return self.df
+
+    def publish(self, df: pd.DataFrame) -> int:
+        """Publish df as the new version and return the version"""
+        self.version = publish(df, self.name)
+        self.generation = _read_pointer(self.name)[0]
+        self.df = df
+        self.publishing = True
+        return self.version
+
+    def close(self) -> None:
+        """
+        Drop the DataFrame and close the segments it was read from
+
+        Any other references to the DataFrame must be dropped first, otherwise
+        its segment stays open.
+        """
+        self.df = None
+        gc.collect()
+
+        # What this process publishes stays open until it's unlinked
+        if self.name in _pointers:
+            return
+
+        for segment_name in list(_segments):
+            if _segment_owner(segment_name) == self.name:
+                _release(segment_name)
+
+    def unlink(self) -> None:
+        """Stop publishing: remove the DataFrame from shared memory and close"""
+        unlink(self.name)
+        self.publishing = False
+        self.close()
@@ -0,0 +1,202 @@
+# Transports for running queries without talking to PokeAPI
+#
+# RecordingTransport runs queries on a real transport and saves every
+# response to a JSON file. ReplayTransport answers queries from such a file,
+# optionally with extra latency and injected errors, so run_query can be
+# exercised end to end (and under heavy concurrency) with no network.
+# serve_replay puts a ReplayTransport behind a tiny local GraphQL server so
+# the real AIOHTTPTransport can be pointed at it as well.
+#
+# To route queries through one of these, set the transport factory:
+#
+#     replay = ReplayTransport("pokeapi.json", latency=0.05)
+#     poked.client.transport_factory = lambda: replay
+
+import asyncio
+import json
+import os
+import random
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from aiohttp import web
+from gql.transport.async_transport import AsyncTransport
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+from graphql import DocumentNode, ExecutionResult, parse, print_ast
+
+
+def request_key(
+    document: Union[DocumentNode, str], variable_values: Optional[Dict[str, Any]]
+) -> str:
+    """Return the key a query and its variables are recorded under"""
+    # Printing the parsed query normalizes whitespace, so the same query
+    # matches whether it came from gql() or over HTTP
+    if isinstance(document, str):
+        document = parse(document)
+
+    return json.dumps(
+        {"query": print_ast(document), "variables": variable_values or {}},
+        sort_keys=True,
+    )
+
+
+def load_recordings(path: str) -> Dict[str, Dict[str, Any]]:
+    """Load recorded responses from the given file"""
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_recordings(path: str, recordings: Dict[str, Dict[str, Any]]):
+    """Save recorded responses to the given file"""
+    with open(path, "w") as f:
+        json.dump(recordings, f)
+
+
+class RecordingTransport(AsyncTransport):
+    """
+    Run queries on real transports and record their responses
+
+    A fresh transport is built from transport_factory for every query, so a
+    single RecordingTransport can be shared by concurrent sessions. The
+    recordings are written to path whenever a session closes.
+    """
+
+    def __init__(self, path: str, transport_factory: Callable[[], AsyncTransport]):
+        self.path = path
+        self.transport_factory = transport_factory
+
+        # Add to an existing recording rather than starting over
+        self.recordings: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            self.recordings = load_recordings(path)
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        save_recordings(self.path, self.recordings)
+
+    async def execute(
+        self,
+        document: DocumentNode,
+        variable_values: Optional[Dict[str, Any]] = None,
+        operation_name: Optional[str] = None,
+    ) -> ExecutionResult:
+        transport = self.transport_factory()
+        await transport.connect()
+        try:
+            result = await transport.execute(document, variable_values, operation_name)
+        finally:
+            await transport.close()
+
+        recording: Dict[str, Any] = {"data": result.data}
+        if result.errors:
+            recording["errors"] = result.errors
+        self.recordings[request_key(document, variable_values)] = recording
+
+        return result
+
+    def subscribe(self, *args, **kwargs):
+        raise NotImplementedError("Subscriptions can't be recorded")
+
+
+class ReplayTransport(AsyncTransport):
+    """
+    Answer queries from recorded responses
+
+    Each query waits latency seconds plus up to jitter seconds more, then fails
+    with a TransportServerError with probability error_rate. Pass a seed to
+    make the latency and errors repeatable.
+    """
+
+    def __init__(
+        self,
+        recordings: Union[str, Dict[str, Dict[str, Any]]],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        if isinstance(recordings, str):
+            recordings = load_recordings(recordings)
+
+        self.recordings = recordings
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+        # How many queries were executed, for checking load tests
+        self.executed = 0
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def execute(
+        self,
+        document: DocumentNode,
+        variable_values: Optional[Dict[str, Any]] = None,
+        operation_name: Optional[str] = None,
+    ) -> ExecutionResult:
+        self.executed += 1
+
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self.random.random() < self.error_rate:
+            raise TransportServerError("Injected server error", 503)
+
+        key = request_key(document, variable_values)
+        if key not in self.recordings:
+            raise TransportQueryError(f"No recorded response for query: {key}")
+
+        recording = self.recordings[key]
+        return ExecutionResult(data=recording["data"], errors=recording.get("errors"))
+
+    def subscribe(self, *args, **kwargs):
+        raise NotImplementedError("Subscriptions can't be replayed")
+
+
+async def serve_replay(
+    transport: ReplayTransport, host: str = "127.0.0.1", port: int = 0
+) -> Tuple[web.AppRunner, str]:
+    """
+    Serve recorded responses as a GraphQL endpoint over HTTP
+
+    Returns the running server and its URL. Call cleanup() on the server to
+    stop it. With the default port of 0 a free port is picked.
+    """
+
+    async def handle(request: web.Request) -> web.Response:
+        payload = await request.json()
+        try:
+            result = await transport.execute(
+                parse(payload["query"]),
+                payload.get("variables"),
+                payload.get("operationName"),
+            )
+        except TransportServerError as e:
+            return web.json_response(
+                {"errors": [{"message": str(e)}]}, status=e.code or 500
+            )
+        except TransportQueryError as e:
+            return web.json_response({"errors": [{"message": str(e)}]})
+
+        response: Dict[str, Any] = {"data": result.data}
+        if result.errors:
+            response["errors"] = result.errors
+        return web.json_response(response)
+
+    app = web.Application()
+    app.router.add_post("/", handle)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}/"
@@ -44,6 +44,27 @@ class TestClient(unittest.TestCase):
         opened_file = mock_open.return_value.__enter__.return_value
         opened_file.read.assert_called_once_with()
 
+    @patch("time.time", return_value=1000.0)
+    @patch("os.path.getmtime", return_value=400.0)
+    def test_get_cache_age(
+        self,
+        mock_getmtime,
+        mock_time,
+        mock_user_cache_dir,
+        mock_exists,
+        mock_makedirs,
+        mock_remove,
+        mock_open,
+    ):
+        self.assertEqual(cache.get_cache_age("test"), None)
+        mock_getmtime.assert_not_called()
+
+        mock_exists.return_value = True
+        self.assertEqual(cache.get_cache_age("test"), 600.0)
+        mock_getmtime.assert_called_once_with(
+            "/tmp/poked/9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+        )
+
     def test_cache_query(
         self, mock_user_cache_dir, mock_exists, mock_makedirs, mock_remove, mock_open
     ):
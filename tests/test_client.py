@@ -1,15 +1,41 @@
 # Time to test client.py
 # Path: poked/test_client.py
 
+import asyncio
 import unittest
 from unittest.mock import AsyncMock, patch
 
+import aiohttp
 import pandas as pd
 from gql import gql
+from gql.transport.exceptions import TransportQueryError, TransportServerError
 
 import poked.client as client
 
 
+def make_pokemon(id, name, base_experience=64):
+    """Build a minimal raw pokemon record as returned by the API"""
+    return {
+        "id": id,
+        "name": name,
+        "base_experience": base_experience,
+        "height": 7,
+        "weight": 69,
+        "pokemon_v2_pokemonstats": [
+            {"base_stat": 45, "effort": 0, "pokemon_v2_stat": {"name": "hp"}},
+        ],
+        "pokemon_v2_pokemontypes": [{"slot": 1, "pokemon_v2_type": {"name": "grass"}}],
+        "pokemon_v2_pokemongameindices": [],
+        "pokemon_v2_pokemonspecy": {
+            "base_happiness": 50,
+            "capture_rate": 45,
+            "pokemon_v2_pokemoncolor": {"name": "green"},
+            "pokemon_v2_evolutionchain": None,
+            "pokemon_v2_pokemonshape": None,
+        },
+    }
+
+
 class TestClient(unittest.IsolatedAsyncioTestCase):
     def test_client(self):
         # Just bootstrapping here
@@ -71,6 +97,295 @@ class TestClient(unittest.IsolatedAsyncioTestCase):
 
         graphql_client.execute.assert_called_with(query, variable_values=None)
 
+    @patch("poked.cache.get_cached_query", return_value=None)
+    @patch("poked.cache.cache_query", return_value=None)
+    async def test_autocache_variables(self, mock_cache, mock_get):
+        async def func(query, variables=None):
+            return f"Queried: {query} {variables}"
+
+        cached_query = client.autocache(func)
+
+        await cached_query("test", variables={"offset": 5, "limit": 2})
+
+        key = 'test{"limit": 2, "offset": 5}'
+        mock_get.assert_called_with(key)
+        mock_cache.assert_called_with(key, "Queried: test {'offset': 5, 'limit': 2}")
+
+    @patch("poked.cache.get_cache_age", return_value=100.0)
+    @patch("poked.cache.get_cached_query", return_value="Cached")
+    @patch("poked.cache.cache_query", return_value=None)
+    async def test_autocache_stale(self, mock_cache, mock_get, mock_age):
+        async def func(query):
+            return f"Queried: {query}"
+
+        cached_query = client.autocache(func, client.RefreshPolicy(max_age=10))
+
+        # The stale result is served right away
+        result = await cached_query("test")
+        self.assertEqual(result, "Cached")
+        mock_cache.assert_not_called()
+
+        # While a fresh one is fetched in the background
+        await client._revalidating["test"]
+        mock_cache.assert_called_with("test", "Queried: test")
+        self.assertNotIn("test", client._revalidating)
+
+    @patch("poked.cache.get_cache_age", return_value=5.0)
+    @patch("poked.cache.get_cached_query", return_value="Cached")
+    @patch("poked.cache.cache_query", return_value=None)
+    async def test_autocache_fresh(self, mock_cache, mock_get, mock_age):
+        async def func(query):
+            return f"Queried: {query}"
+
+        cached_query = client.autocache(func, client.RefreshPolicy(max_age=10))
+
+        result = await cached_query("test")
+        self.assertEqual(result, "Cached")
+        self.assertNotIn("test", client._revalidating)
+
+    def test_backoff_delay(self):
+        policy = client.RefreshPolicy(backoff=1.0, max_backoff=5.0)
+        for attempt in range(10):
+            delay = policy.backoff_delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(5.0, 2**attempt))
+
+    @patch("poked.client.breaker", client.CircuitBreaker())
+    @patch("asyncio.sleep", new_callable=AsyncMock)
+    @patch("poked.cache.get_cached_query", return_value=None)
+    @patch("poked.cache.cache_query", return_value=None)
+    async def test_run_query_retries(self, mock_cache, mock_get, mock_sleep):
+        graphql_client = AsyncMock()
+        graphql_client.execute.side_effect = [
+            TransportServerError("flaky", 503),
+            {"ok": True},
+        ]
+
+        result = await client.run_query("{ junk }", client=graphql_client)
+
+        self.assertEqual(result, {"ok": True})
+        self.assertEqual(graphql_client.execute.call_count, 2)
+        mock_sleep.assert_called_once()
+        mock_cache.assert_called_with("{ junk }", {"ok": True})
+
+    @patch("poked.client._fallback_text", None)
+    @patch("poked.client.breaker", client.CircuitBreaker(failure_threshold=2))
+    @patch("asyncio.sleep", new_callable=AsyncMock)
+    @patch("requests.get")
+    @patch("poked.cache.get_cached_query", return_value=None)
+    @patch("poked.cache.cache_query", return_value=None)
+    async def test_run_query_circuit_breaker(
+        self, mock_cache, mock_get, mock_requests_get, mock_sleep
+    ):
+        mock_requests_get.return_value.text = '{"old": "data"}'
+        graphql_client = AsyncMock()
+        graphql_client.execute.side_effect = aiohttp.ClientConnectionError("down")
+        policy = client.RefreshPolicy(retries=5)
+
+        result = await client.run_query(
+            "{ junk }", client=graphql_client, policy=policy
+        )
+
+        # The breaker opens after two failures instead of using every retry
+        self.assertEqual(result, {"old": "data"})
+        self.assertEqual(graphql_client.execute.call_count, 2)
+        mock_cache.assert_not_called()
+
+        # And further queries fall back without trying PokeAPI at all
+        await client.run_query("{ junk }", client=graphql_client, policy=policy)
+        self.assertEqual(graphql_client.execute.call_count, 2)
+
+        # The fallback data is only downloaded once
+        mock_requests_get.assert_called_once_with(client.fallback_url)
+
+    @patch("poked.client.breaker", client.CircuitBreaker(failure_threshold=1))
+    @patch("asyncio.sleep", new_callable=AsyncMock)
+    @patch("poked.cache.get_cached_query", return_value=None)
+    @patch("poked.cache.cache_query", return_value=None)
+    async def test_execute_query_permanent_error(
+        self, mock_cache, mock_get, mock_sleep
+    ):
+        graphql_client = AsyncMock()
+        graphql_client.execute.side_effect = TransportQueryError("bad query")
+
+        with self.assertRaises(TransportQueryError):
+            await client.execute_query("{ junk }", client=graphql_client)
+
+        # Not retried, and not held against PokeAPI
+        self.assertEqual(graphql_client.execute.call_count, 1)
+        mock_sleep.assert_not_called()
+        self.assertTrue(client.breaker.allow())
+
+    @patch.object(client.PokemonClient, "_all_pokemon_df", None)
+    @patch("poked.client.execute_query")
+    async def test_iter_pokemon(self, mock_execute_query):
+        pokemon = [make_pokemon(i, f"mon-{i}") for i in range(1, 6)]
+
+        async def execute_query(query, variables=None, policy=None):
+            start = variables["offset"]
+            page = pokemon[start : start + variables["limit"]]
+            return {"pokemon_v2_pokemon": page}
+
+        mock_execute_query.side_effect = execute_query
+
+        chunks = [chunk async for chunk in client.iter_pokemon(chunk_size=2)]
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(list(pd.concat(chunks).index), [1, 2, 3, 4, 5])
+        self.assertEqual(chunks[2]["Name"][5], "mon-5")
+        self.assertEqual(mock_execute_query.call_count, 3)
+
+    @patch.object(client.PokemonClient, "_all_pokemon_df", None)
+    @patch("poked.client.fallback_data", new_callable=AsyncMock)
+    @patch("poked.client.execute_query", side_effect=TransportServerError("down"))
+    async def test_iter_pokemon_unpaginated(self, mock_execute_query, mock_fallback):
+        # The fallback data ignores limit and offset entirely
+        mock_fallback.return_value = {
+            "pokemon_v2_pokemon": [make_pokemon(i, f"mon-{i}") for i in range(1, 6)]
+        }
+
+        chunks = [chunk async for chunk in client.iter_pokemon(chunk_size=2)]
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        mock_execute_query.assert_called_once()
+        mock_fallback.assert_called_once()
+
+    @patch.object(client.PokemonClient, "_all_pokemon_df", None)
+    @patch("poked.client.fallback_data", new_callable=AsyncMock)
+    @patch("poked.client.execute_query")
+    async def test_iter_pokemon_fallback_midstream(
+        self, mock_execute_query, mock_fallback
+    ):
+        pokemon = [make_pokemon(i, f"mon-{i}") for i in range(1, 8)]
+
+        # The first two pages work, then we get the whole fallback dump
+        async def execute_query(query, variables=None, policy=None):
+            if variables["offset"] >= 4:
+                raise TransportServerError("down")
+            start = variables["offset"]
+            return {"pokemon_v2_pokemon": pokemon[start : start + 2]}
+
+        mock_execute_query.side_effect = execute_query
+        mock_fallback.return_value = {"pokemon_v2_pokemon": pokemon}
+
+        chunks = [chunk async for chunk in client.iter_pokemon(chunk_size=2)]
+
+        self.assertEqual(list(pd.concat(chunks).index), [1, 2, 3, 4, 5, 6, 7])
+
+    @patch.object(client.PokemonClient, "_all_pokemon_df", None)
+    @patch("poked.client.fallback_data", new_callable=AsyncMock)
+    @patch("poked.client.execute_query")
+    async def test_iter_pokemon_small_fallback(self, mock_execute_query, mock_fallback):
+        # PokeAPI has more pokemon than the fallback dump, which fits in a
+        # single chunk, so it can't be told apart from a page by its length
+        async def execute_query(query, variables=None, policy=None):
+            if variables["offset"] >= 5:
+                raise TransportServerError("down")
+            start = variables["offset"] + 1
+            return {
+                "pokemon_v2_pokemon": [
+                    make_pokemon(i, f"mon-{i}") for i in range(start, start + 5)
+                ]
+            }
+
+        mock_execute_query.side_effect = execute_query
+        mock_fallback.return_value = {
+            "pokemon_v2_pokemon": [make_pokemon(i, f"mon-{i}") for i in range(1, 6)]
+        }
+
+        chunks = [chunk async for chunk in client.iter_pokemon(chunk_size=5)]
+
+        # The dump has nothing past what we already yielded
+        self.assertEqual(list(pd.concat(chunks).index), [1, 2, 3, 4, 5])
+        self.assertEqual(mock_execute_query.call_count, 2)
+        mock_fallback.assert_called_once()
+
+    @patch.object(client.PokemonClient, "_all_pokemon_df", None)
+    @patch("poked.client.execute_query")
+    async def test_iter_pokemon_stable_dtypes(self, mock_execute_query):
+        pages = [
+            [make_pokemon(1, "mon-1"), make_pokemon(2, "mon-2")],
+            [make_pokemon(3, "mon-3", base_experience=None)],
+        ]
+        mock_execute_query.side_effect = [
+            {"pokemon_v2_pokemon": page} for page in pages
+        ]
+
+        chunks = [chunk async for chunk in client.iter_pokemon(chunk_size=2)]
+
+        for column in client.nullable_numeric_columns:
+            self.assertEqual(chunks[0][column].dtype, chunks[1][column].dtype)
+        self.assertEqual(chunks[0]["Base Experience"].dtype, "float64")
+
+    @patch.object(client.PokemonClient, "_all_pokemon_df", None)
+    @patch.object(client.PokemonClient, "_fetched_at", None)
+    @patch("poked.client.refresh_policy", client.RefreshPolicy(max_age=60))
+    @patch("poked.client.revalidate")
+    @patch("poked.cache.get_cache_age", return_value=100.0)
+    @patch("poked.cache.get_cached_query")
+    async def test_list_pokemon_rebuilds_when_stale(
+        self, mock_get, mock_age, mock_revalidate
+    ):
+        mock_get.side_effect = lambda key: {
+            "pokemon_v2_pokemon": [make_pokemon(1, "mon-1")]
+        }
+
+        async def refresh():
+            return {
+                "pokemon_v2_pokemon": [
+                    make_pokemon(1, "mon-1"),
+                    make_pokemon(2, "mon-2"),
+                ]
+            }
+
+        mock_revalidate.side_effect = lambda *args: asyncio.ensure_future(refresh())
+
+        # Built from the stale cached result at first
+        self.assertEqual(len(await client.list_pokemon()), 1)
+
+        # Later lookups still get it right away while it's rebuilt
+        self.assertEqual(len(await client.list_pokemon()), 1)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        self.assertEqual(len(await client.list_pokemon()), 2)
+        pokemon = await client.get_pokemon("mon-2")
+        self.assertEqual(pokemon.name, 2)
+
+        # The rebuilt DataFrame is fresh, so it isn't rebuilt again
+        calls = mock_revalidate.call_count
+        await client.list_pokemon()
+        self.assertEqual(mock_revalidate.call_count, calls)
+
+    @patch("poked.client.execute_query", new_callable=AsyncMock)
+    async def test_warm_cache(self, mock_execute_query):
+        pokemon = [make_pokemon(i, f"mon-{i}") for i in range(1, 6)]
+
+        async def execute_query(query, variables=None):
+            if variables is None:
+                return {"pokemon_v2_pokemon": pokemon}
+            start = variables["offset"]
+            return {"pokemon_v2_pokemon": pokemon[start : start + variables["limit"]]}
+
+        mock_execute_query.side_effect = execute_query
+
+        count = await client.warm_cache(chunk_size=2)
+
+        self.assertEqual(count, 5)
+        # The whole list, then the same pages iter_pokemon reads
+        self.assertEqual(
+            [
+                call.kwargs.get("variables")
+                for call in mock_execute_query.call_args_list
+            ],
+            [
+                None,
+                {"limit": 2, "offset": 0},
+                {"limit": 2, "offset": 2},
+                {"limit": 2, "offset": 4},
+            ],
+        )
+
     async def test_convert_list_query_data(self):
         query = gql(
             """
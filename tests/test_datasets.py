@@ -0,0 +1,206 @@
+import unittest
+import uuid
+from unittest.mock import AsyncMock, patch
+
+import pandas as pd
+from gql import gql
+
+import poked.datasets as datasets
+import poked.queries as queries
+import poked.shared as shared
+
+dataset = queries.Dataset(
+    name="test_pokemon",
+    table="pokemon_v2_pokemon",
+    columns={"Name": "name", "Color": "pokemon_v2_pokemonspecy.color.name"},
+    lists={"Games": queries.ListRule("pokemon_v2_pokemongameindices", "game.name")},
+    pivots={
+        "Type": queries.PivotRule(
+            "pokemon_v2_pokemontypes",
+            "slot",
+            "pokemon_v2_type.name",
+            names={1: "Type (Primary)", 2: "Type (Secondary)"},
+        )
+    },
+    dtypes={"Color": "category"},
+)
+
+rows = [
+    {
+        "id": 1,
+        "name": "bulbasaur",
+        "pokemon_v2_pokemonspecy": {"color": {"name": "green"}},
+        "pokemon_v2_pokemongameindices": [
+            {"game": {"name": "red"}},
+            {"game": {"name": "blue"}},
+        ],
+        "pokemon_v2_pokemontypes": [
+            {"slot": 1, "pokemon_v2_type": {"name": "grass"}},
+            {"slot": 2, "pokemon_v2_type": {"name": "poison"}},
+        ],
+    },
+    {
+        "id": 4,
+        "name": "charmander",
+        "pokemon_v2_pokemonspecy": None,
+        "pokemon_v2_pokemongameindices": [],
+        "pokemon_v2_pokemontypes": [{"slot": 1, "pokemon_v2_type": {"name": "fire"}}],
+    },
+]
+
+
+class TestDatasets(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Don't let cached DataFrames leak between tests
+        patcher = patch.dict(datasets._frames, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_query(self):
+        query = dataset.query()
+        gql(query)
+        self.assertIn("pokemon_v2_pokemon(order_by: {id: asc})", query)
+        self.assertIn("pokemon_v2_type {\n", query)
+
+        gql(dataset.query(paged=True))
+
+    def test_builtin_queries(self):
+        for builtin in queries.datasets.values():
+            gql(builtin.query())
+            gql(builtin.query(paged=True))
+
+    def test_convert(self):
+        df = datasets.convert(dataset, rows)
+
+        self.assertEqual(list(df.index), [1, 4])
+        self.assertEqual(df.index.name, "id")
+        self.assertEqual(
+            list(df.columns),
+            ["Name", "Color", "Games", "Type (Primary)", "Type (Secondary)"],
+        )
+        self.assertEqual(df["Color"].dtype, "category")
+
+        self.assertEqual(df.loc[1, "Games"], ["red", "blue"])
+        self.assertEqual(df.loc[1, "Type (Secondary)"], "poison")
+        self.assertEqual(df.loc[4, "Type (Primary)"], "fire")
+        self.assertIsNone(df.loc[4, "Games"])
+        self.assertTrue(pd.isna(df.loc[4, "Color"]))
+        self.assertTrue(pd.isna(df.loc[4, "Type (Secondary)"]))
+
+    def test_unknown_dataset(self):
+        with self.assertRaises(ValueError):
+            datasets.get_dataset("nope")
+
+    @patch("poked.client.run_query", new_callable=AsyncMock)
+    async def test_load_dataset(self, mock_run_query):
+        mock_run_query.return_value = {"pokemon_v2_pokemon": rows}
+
+        df = await datasets.load_dataset(dataset)
+        self.assertEqual(list(df["Name"]), ["bulbasaur", "charmander"])
+
+        # The second load comes from memory
+        await datasets.load_dataset(dataset)
+        mock_run_query.assert_called_once_with(dataset.query())
+
+    @patch.dict(datasets._shared, clear=True)
+    @patch("poked.client.run_query", new_callable=AsyncMock)
+    async def test_publish_shared_memory(self, mock_run_query):
+        published = queries.Dataset(
+            name=f"test_{uuid.uuid4().hex[:8]}",
+            table=dataset.table,
+            columns=dataset.columns,
+        )
+        name = datasets.shared_name(published)
+        self.addCleanup(shared.unlink, name)
+
+        mock_run_query.return_value = {"pokemon_v2_pokemon": rows[:1]}
+        self.assertEqual(await datasets.publish_shared_memory(published), 1)
+
+        # Publishing again fetches the dataset again rather than reusing it
+        mock_run_query.return_value = {"pokemon_v2_pokemon": rows}
+        self.assertEqual(await datasets.publish_shared_memory(published), 2)
+        self.assertEqual(mock_run_query.call_count, 2)
+
+        self.assertEqual(list(shared.attach(name)[1].index), [1, 4])
+        self.assertEqual(list((await datasets.load_dataset(published)).index), [1, 4])
+
+    @patch("poked.client.run_query", new_callable=AsyncMock)
+    async def test_load_dataset_fallback(self, mock_run_query):
+        # The fallback data only has pokemon in it
+        mock_run_query.return_value = {"pokemon_v2_pokemon": []}
+
+        with self.assertRaises(RuntimeError):
+            await datasets.load_dataset("moves")
+
+    @patch("poked.client.run_query", new_callable=AsyncMock)
+    @patch("poked.client.list_pokemon", new_callable=AsyncMock)
+    async def test_pokemon_learning(self, mock_list_pokemon, mock_run_query):
+        mock_list_pokemon.return_value = pd.DataFrame(
+            {"Name": ["bulbasaur", "charmander", "pikachu"]},
+            index=pd.Index([1, 4, 25], name="id"),
+        )
+        datasets._frames["moves"] = pd.DataFrame(
+            {"Name": ["thunderbolt", "ember"]}, index=pd.Index([85, 52], name="id")
+        )
+
+        def learnset(id, pokemon_id, level, method):
+            return {
+                "id": id,
+                "pokemon_id": pokemon_id,
+                "move_id": 85,
+                "level": level,
+                "pokemon_v2_movelearnmethod": {"name": method},
+                "pokemon_v2_versiongroup": {"name": "red-blue"},
+            }
+
+        mock_run_query.return_value = {
+            "pokemon_v2_pokemonmove": [
+                learnset(1, 25, 26, "level-up"),
+                learnset(2, 25, 29, "level-up"),
+                learnset(3, 25, 0, "machine"),
+                learnset(4, 1, 0, "machine"),
+            ]
+        }
+
+        learners = await datasets.pokemon_learning("thunderbolt")
+
+        # Only this move's learnset is fetched
+        mock_run_query.assert_called_once_with(
+            queries.learnsets.query(where="pokemon_v2_move.name"),
+            variables={"value": "thunderbolt"},
+        )
+
+        self.assertEqual(list(learners["Name"]), ["bulbasaur", "pikachu"])
+        # Machines don't count towards the level
+        self.assertEqual(learners.loc[25, "Level"], 26)
+        self.assertTrue(pd.isna(learners.loc[1, "Level"]))
+        self.assertEqual(learners.loc[25, "Learn Methods"], ["level-up", "machine"])
+        self.assertEqual(learners.loc[1, "Learn Methods"], ["machine"])
+
+        with self.assertRaises(ValueError):
+            await datasets.pokemon_learning("splash")
+
+    def test_query_where(self):
+        query = queries.learnsets.query(paged=True, where="pokemon_v2_move.name")
+        gql(query)
+        self.assertIn("($limit: Int, $offset: Int, $value: String!)", query)
+        self.assertIn("where: {pokemon_v2_move: {name: {_eq: $value}}}", query)
+
+    @patch("poked.client.execute_query")
+    async def test_iter_dataset(self, mock_execute_query):
+        async def execute_query(query, variables=None, policy=None):
+            start = variables["offset"]
+            return {"pokemon_v2_pokemon": rows[start : start + variables["limit"]]}
+
+        mock_execute_query.side_effect = execute_query
+
+        chunks = [chunk async for chunk in datasets.iter_dataset(dataset, 1)]
+
+        self.assertEqual([list(chunk.index) for chunk in chunks], [[1], [4]])
+        # Each chunk would have different categories, which concat drops
+        self.assertEqual(chunks[0]["Color"].dtype, chunks[1]["Color"].dtype)
+        self.assertEqual(pd.concat(chunks)["Color"].dtype, chunks[0]["Color"].dtype)
+
+
+if __name__ == "__main__":
+    unittest.main()
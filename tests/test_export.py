@@ -0,0 +1,125 @@
+import io
+import json
+import unittest
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+import pandas as pd
+
+import poked.export as export
+
+
+async def make_chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def make_chunk(ids, names, hp):
+    return pd.DataFrame(
+        {
+            "Name": names,
+            "HP": hp,
+            "Game Appearances": [["red", "blue"]] + [None] * (len(ids) - 1),
+        },
+        index=pd.Index(ids, name="id"),
+    )
+
+
+class TestExport(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.chunks = [
+            make_chunk([1, 2], ["bulbasaur", "ivysaur"], [45, 60]),
+            make_chunk([3], ["venusaur"], [80]),
+        ]
+
+    def test_format_for_filename(self):
+        self.assertEqual(export.format_for_filename("out.csv"), "csv")
+        self.assertEqual(export.format_for_filename("out.jsonl"), "ndjson")
+        self.assertEqual(export.format_for_filename("out.parquet"), "parquet")
+        self.assertEqual(export.format_for_filename("out"), None)
+
+    async def test_export_csv(self):
+        out = io.StringIO()
+        rows = await export.export(make_chunks(*self.chunks), out)
+
+        self.assertEqual(rows, 3)
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                "id,Name,HP,Game Appearances",
+                "1,bulbasaur,45,red|blue",
+                "2,ivysaur,60,",
+                "3,venusaur,80,red|blue",
+            ],
+        )
+
+    async def test_export_ndjson(self):
+        out = io.StringIO()
+        rows = await export.export(make_chunks(*self.chunks), out, format="ndjson")
+
+        self.assertEqual(rows, 3)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(records[0]["Game Appearances"], ["red", "blue"])
+        self.assertEqual([record["id"] for record in records], [1, 2, 3])
+
+    async def test_export_columns_and_where(self):
+        out = io.StringIO()
+        rows = await export.export(
+            make_chunks(*self.chunks), out, columns=["Name"], where="HP > 50"
+        )
+
+        self.assertEqual(rows, 2)
+        self.assertEqual(
+            out.getvalue().splitlines(), ["id,Name", "2,ivysaur", "3,venusaur"]
+        )
+
+    async def test_export_csv_lists_after_first_chunk(self):
+        # The list column is all None in the first chunk
+        first = make_chunk([1], ["bulbasaur"], [45]).assign(
+            **{"Game Appearances": [None]}
+        )
+        out = io.StringIO()
+        await export.export(make_chunks(first, self.chunks[1]), out)
+
+        self.assertEqual(out.getvalue().splitlines()[2], "3,venusaur,80,red|blue")
+
+    @unittest.skipIf(pq is None, "pyarrow is not installed")
+    async def test_export_parquet(self):
+        # All None lists and whole numbers first, then lists and gaps
+        first = make_chunk([1, 2], ["bulbasaur", "ivysaur"], [45, 60]).assign(
+            **{"Game Appearances": [None, None]}
+        )
+        second = make_chunk([3], ["venusaur"], [None])
+        out = io.BytesIO()
+
+        rows = await export.export(
+            make_chunks(first, second),
+            out,
+            format="parquet",
+            list_columns=["Game Appearances"],
+        )
+
+        self.assertEqual(rows, 3)
+        table = pq.read_table(io.BytesIO(out.getvalue()))
+        self.assertEqual(table.schema.field("HP").type, pa.int64())
+        self.assertEqual(
+            table.schema.field("Game Appearances").type.value_type, pa.string()
+        )
+        self.assertEqual(table.column("HP").to_pylist(), [45, 60, None])
+        self.assertEqual(
+            table.column("Game Appearances").to_pylist(), [None, None, ["red", "blue"]]
+        )
+
+    async def test_export_unknown_column(self):
+        with self.assertRaises(ValueError):
+            await export.export(
+                make_chunks(*self.chunks), io.StringIO(), columns=["Nope"]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import subprocess
+import sys
+import unittest
+import uuid
+from unittest.mock import patch
+
+import pandas as pd
+
+import poked.client as client
+import poked.shared as shared
+
+
+class TestShared(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Use a unique name so test runs don't collide
+        self.name = f"poked_test_{uuid.uuid4().hex[:8]}"
+        self.addCleanup(shared.unlink, self.name)
+
+        self.df = pd.DataFrame(
+            {
+                "Name": ["bulbasaur", "ivysaur"],
+                "HP": [45, 60],
+                "Evolution Chain": [["bulbasaur", "ivysaur"]] * 2,
+            },
+            index=pd.Index([1, 2], name="id"),
+        )
+
+    def test_attach_nothing_published(self):
+        self.assertEqual(shared.current_version(self.name), 0)
+        self.assertIsNone(shared.attach(self.name))
+
+    def test_publish_and_attach(self):
+        version = shared.publish(self.df, self.name)
+        self.assertEqual(version, 1)
+
+        attached_version, attached = shared.attach(self.name)
+        self.assertEqual(attached_version, 1)
+        pd.testing.assert_frame_equal(attached, self.df)
+
+        # Numeric columns are views into shared memory, not private copies
+        self.assertFalse(attached["HP"].to_numpy().flags.writeable)
+
+    def test_shared_frame(self):
+        reader = shared.SharedFrame(self.name)
+        self.assertIsNone(reader.refresh())
+
+        writer = shared.SharedFrame(self.name)
+        self.assertEqual(writer.publish(self.df), 1)
+
+        pd.testing.assert_frame_equal(reader.refresh(), self.df)
+        self.assertEqual(reader.version, 1)
+
+        writer.publish(self.df.assign(HP=[46, 61]))
+        self.assertEqual(list(reader.refresh()["HP"]), [46, 61])
+        self.assertEqual(reader.version, 2)
+
+    def test_publisher_restart(self):
+        reader = shared.SharedFrame(self.name)
+        writer = shared.SharedFrame(self.name)
+        writer.publish(self.df)
+        reader.refresh()
+
+        # A new publisher starts over at version 1 with a new pointer
+        writer.unlink()
+        restarted = shared.SharedFrame(self.name)
+        self.assertEqual(restarted.publish(self.df.assign(HP=[46, 61])), 1)
+
+        self.assertEqual(list(reader.refresh()["HP"]), [46, 61])
+        self.assertEqual(reader.generation, restarted.generation)
+
+    def test_close_and_unlink(self):
+        writer = shared.SharedFrame(self.name)
+        writer.publish(self.df)
+
+        reader = shared.SharedFrame(self.name)
+        reader.refresh()
+        reader.close()
+        self.assertIsNone(reader.df)
+        self.assertEqual(shared.current_version(self.name), 1)
+
+        writer.unlink()
+        self.assertEqual(shared.current_version(self.name), 0)
+        self.assertIsNone(reader.refresh())
+
+    def run_python(self, code):
+        """Run code in a fresh process and return what it wrote to stderr"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        process = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=root,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(process.returncode, 0, process.stderr)
+        return process.stderr
+
+    def test_clean_exit(self):
+        # A publisher unlinks what it published when it exits, without the
+        # resource tracker warning about leaked segments
+        stderr = self.run_python(
+            "import pandas as pd\n"
+            "import poked.shared as shared\n"
+            f"shared.SharedFrame({self.name!r}).publish(pd.DataFrame({{'HP': [45]}}))\n"
+        )
+        self.assertEqual(stderr, "")
+        self.assertEqual(shared.current_version(self.name), 0)
+
+        # A reader closes its segments without complaining they're in use
+        shared.publish(self.df, self.name)
+        stderr = self.run_python(
+            "import poked.client as client\n"
+            f"client.PokemonClient.use_shared_memory({self.name!r})\n"
+            "assert client.PokemonClient._all_pokemon_df['HP'].sum() == 105\n"
+        )
+        self.assertEqual(stderr, "")
+        self.assertEqual(shared.current_version(self.name), 1)
+
+    def test_publish_new_version(self):
+        shared.publish(self.df, self.name)
+
+        updated = self.df.assign(HP=[46, 61])
+        version = shared.publish(updated, self.name)
+        self.assertEqual(version, 2)
+
+        attached_version, attached = shared.attach(self.name)
+        self.assertEqual(attached_version, 2)
+        self.assertEqual(list(attached["HP"]), [46, 61])
+
+    @patch.object(client.PokemonClient, "_all_pokemon_df", None)
+    @patch.object(client.PokemonClient, "_shared", None)
+    @patch("poked.client.run_query")
+    async def test_client_uses_shared_memory(self, mock_run_query):
+        shared.publish(self.df, self.name)
+
+        client.PokemonClient.use_shared_memory(self.name)
+        pokemon = await client.get_pokemon("ivysaur")
+        self.assertEqual(pokemon["HP"], 60)
+
+        # A refresh from the publisher is picked up on the next lookup
+        shared.publish(self.df.assign(HP=[46, 61]), self.name)
+        pokemon = await client.get_pokemon("ivysaur")
+        self.assertEqual(pokemon["HP"], 61)
+        self.assertEqual(client.PokemonClient._shared.version, 2)
+
+        # Listing hands back the shared DataFrame rather than a private copy
+        listed = await client.list_pokemon()
+        self.assertIs(listed, client.PokemonClient._all_pokemon_df)
+        self.assertFalse(listed["HP"].to_numpy().flags.writeable)
+
+        mock_run_query.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
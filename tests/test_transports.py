@@ -0,0 +1,135 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from gql import Client, gql
+from gql.transport.aiohttp import AIOHTTPTransport
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+from graphql import build_schema, get_introspection_query, introspection_from_schema
+
+import poked.client as client
+import poked.transports as transports
+
+schema = build_schema(
+    """
+    type Query {
+      pokemon_v2_pokemon(limit: Int, offset: Int): [Pokemon!]!
+    }
+
+    type Pokemon {
+      id: Int!
+      name: String!
+    }
+    """
+)
+
+query = "{ pokemon_v2_pokemon(limit: 2) { id name } }"
+
+data = {
+    "pokemon_v2_pokemon": [
+        {"id": 1, "name": "bulbasaur"},
+        {"id": 2, "name": "ivysaur"},
+    ]
+}
+
+
+def make_recordings():
+    # Sessions fetch the schema first, so that has to be recorded too
+    return {
+        transports.request_key(get_introspection_query(), None): {
+            "data": introspection_from_schema(schema)
+        },
+        transports.request_key(query, None): {"data": data},
+    }
+
+
+class TestTransports(unittest.IsolatedAsyncioTestCase):
+    def test_request_key(self):
+        # Whitespace doesn't matter, variables do
+        self.assertEqual(
+            transports.request_key(query, None),
+            transports.request_key(
+                gql("{\n pokemon_v2_pokemon(limit: 2) {id name}}"), {}
+            ),
+        )
+        self.assertNotEqual(
+            transports.request_key(query, None),
+            transports.request_key(query, {"offset": 2}),
+        )
+
+    async def test_replay(self):
+        replay = transports.ReplayTransport(make_recordings())
+        result = await replay.execute(gql(query))
+
+        self.assertEqual(result.data, data)
+        self.assertEqual(replay.executed, 1)
+
+    async def test_replay_missing(self):
+        replay = transports.ReplayTransport(make_recordings())
+
+        with self.assertRaises(TransportQueryError):
+            await replay.execute(gql("{ pokemon_v2_pokemon { id } }"))
+
+    async def test_replay_errors(self):
+        replay = transports.ReplayTransport(make_recordings(), error_rate=1.0)
+
+        with self.assertRaises(TransportServerError):
+            await replay.execute(gql(query))
+
+    async def test_record_and_replay(self):
+        path = os.path.join(tempfile.mkdtemp(), "recordings.json")
+        recorder = transports.RecordingTransport(
+            path, lambda: transports.ReplayTransport(make_recordings())
+        )
+
+        async with Client(
+            transport=recorder, fetch_schema_from_transport=True
+        ) as session:
+            result = await session.execute(gql(query))
+        self.assertEqual(result, data)
+
+        replay = transports.ReplayTransport(path)
+        async with Client(
+            transport=replay, fetch_schema_from_transport=True
+        ) as session:
+            result = await session.execute(gql(query))
+        self.assertEqual(result, data)
+
+    @patch("poked.client.breaker", client.CircuitBreaker())
+    @patch("poked.cache.get_cached_query", return_value=None)
+    @patch("poked.cache.cache_query", return_value=None)
+    async def test_concurrent_queries(self, mock_cache, mock_get):
+        replay = transports.ReplayTransport(
+            make_recordings(), latency=0.01, jitter=0.01, seed=0
+        )
+
+        with patch("poked.client.transport_factory", lambda: replay):
+            results = await asyncio.gather(
+                *[client.run_query(query) for _ in range(200)]
+            )
+
+        self.assertEqual(results, [data] * 200)
+        # One schema fetch and one query per session
+        self.assertEqual(replay.executed, 400)
+
+    @patch("poked.client.breaker", client.CircuitBreaker())
+    @patch("poked.cache.get_cached_query", return_value=None)
+    @patch("poked.cache.cache_query", return_value=None)
+    async def test_serve_replay(self, mock_cache, mock_get):
+        replay = transports.ReplayTransport(make_recordings())
+        server, url = await transports.serve_replay(replay)
+        self.addAsyncCleanup(server.cleanup)
+
+        with patch("poked.client.transport_factory", lambda: AIOHTTPTransport(url=url)):
+            results = await asyncio.gather(
+                *[client.run_query(query) for _ in range(20)]
+            )
+
+        self.assertEqual(results, [data] * 20)
+        self.assertEqual(replay.executed, 40)
+
+
+if __name__ == "__main__":
+    unittest.main()